@@ -1,4 +1,4 @@
-from typing import List
+import numpy as np
 
 class Header:
     def __init__(self, width: int, height: int, max_color: int):
@@ -30,7 +30,7 @@ class Pixel:
 
 
 class Image:
-    def __init__(self, header: Header, pixels: List[Pixel]):
+    def __init__(self, header: Header, pixels: np.ndarray):
         self.header = header
         self.pixels = pixels
 
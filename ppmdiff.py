@@ -1,9 +1,44 @@
 from data import Header, Pixel, Image, MalformedPixelError,\
         PartialPixelError, P3InvalidHeaderError
+import ctypes
+import os
+import struct
 import sys
-from typing import List, TextIO
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, BinaryIO, List
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
 import utility
 
+# Compiled diff kernel ('make' builds _ppmdiff.so); optional like numba.
+try:
+    _native = ctypes.CDLL(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '_ppmdiff.so'))
+    _native.diff_rgb_u16.restype = None
+    _native.diff_rgb_u16.argtypes = [
+        np.ctypeslib.ndpointer(np.uint16, flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(np.uint16, flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(np.uint16, flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(np.uint8, flags='C_CONTIGUOUS'),
+        ctypes.c_size_t,
+    ]
+    _native.diff_rgb_u8.restype = None
+    _native.diff_rgb_u8.argtypes = [
+        np.ctypeslib.ndpointer(np.uint8, flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(np.uint8, flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(np.uint8, flags='C_CONTIGUOUS'),
+        np.ctypeslib.ndpointer(np.uint8, flags='C_CONTIGUOUS'),
+        ctypes.c_size_t,
+    ]
+except OSError:
+    _native = None
+
 OUT_FILE_DIGITAL = 'diffimage_digital.ppm'
 OUT_FILE_ANALOG = 'diffimage_analog.ppm'
 
@@ -13,6 +48,13 @@ FILE_ARG2 = 2
 
 PROG_NAME = 'ppmdiff.py'
 
+QUIET_FLAG = '--quiet'
+BINARY_FLAG = '--binary'
+
+# Images smaller than this are diffed in-process; worker startup and
+# pickling would cost more than the diff itself.
+PARALLEL_MIN_PIXELS = 1 << 20
+
 COLUMN_MISMATCH = 'widths differ'
 ROW_MISMATCH = 'heights differ'
 MAX_COLOR_MISMATCH = 'color max values differ'
@@ -48,36 +90,112 @@ def error(msg: str) -> None:
 # Print a usage error message.
 # input: program name as string
 def usage(name: str) -> None:
-    error('usage: {} image1.ppm image2.ppm'.format(name))
+    error('usage: {} [--binary] [--quiet] image1.ppm image2.ppm'.format(name))
 
 
 # Attempt to open a file, reporting an error as appropriate.
 # input: file name/path as a string
 # input: read/write mode
-# result: opened file as TextIO
-def open_file(name: str, mode: str) -> TextIO:
+# result: opened file
+def open_file(name: str, mode: str) -> IO:
     try:
         return open(name, mode)
     except IOError as e:
         error('{0}: {1}'.format(name, e.strerror))
 
 
-# Print the header to an output stream.
+# Print the header to a binary output stream.
 # input: output stream
 # input: header as Header
-def write_header(out: TextIO, h: Header) -> None:
-    print('P3\n', file=out)
-    print('{} {}\n'.format(h.width, h.height), file=out)
-    print('{}\n'.format(h.max_color), file=out)
-
-
-# Determine the component difference between two pixels.
-# input: p1 as Pixel
-# input: p2 as Pixel
-# result: difference as Pixel
-def pixel_diff(p1: Pixel, p2: Pixel) -> Pixel:
-    return Pixel(abs(p1.red - p2.red), abs(p1.green - p2.green),
-                 abs(p1.blue - p2.blue))
+# input: binary as bool, emitting a P6 header instead of P3 when True
+def write_header(out: BinaryIO, h: Header, binary: bool) -> None:
+    out.write(b'%s\n%d %d\n%d\n' % (b'P6' if binary else b'P3',
+                                     h.width, h.height, h.max_color))
+
+
+# Pack one output row as raw P6 samples: one byte per sample up to
+# max_color 255, big-endian two-byte samples beyond that.
+# input: row as (red, green, blue) int list
+# input: max_color as int
+# result: packed row bytes
+def _pack_p6_row(row: List[int], max_color: int) -> bytes:
+    if max_color <= 255:
+        return bytes(row)
+    return struct.pack('>3H', *row)
+
+
+# Determine the component differences between two pixel arrays. uint8
+# samples use the overflow-safe unsigned subtract pattern and never widen;
+# uint16 samples widen to int32 for the signed subtraction.
+# input: p1 as sample array of shape (N, 3)
+# input: p2 as sample array of shape (N, 3)
+# result: absolute differences, same dtype and shape as the inputs
+def pixel_diff(p1: np.ndarray, p2: np.ndarray) -> np.ndarray:
+    if p1.dtype == np.uint8:
+        return np.where(p1 >= p2, p1 - p2, p2 - p1)
+    return np.abs(p1.astype(np.int32) - p2.astype(np.int32)).astype(p1.dtype)
+
+
+if numba is not None:
+    # JIT-compiled diff kernel. Fills diff and mismatch in parallel over
+    # pixels; numba lowers the loop to auto-vectorized native code.
+    # input: p1 as sample array of shape (N, 3)
+    # input: p2 as sample array of shape (N, 3)
+    # input: diff as preallocated sample array of shape (N, 3)
+    # input: mismatch as preallocated bool array of shape (N,)
+    @numba.njit(parallel=True, cache=True)
+    def _diff_kernel(p1, p2, diff, mismatch):
+        for i in numba.prange(p1.shape[0]):
+            differs = False
+            for c in range(3):
+                # Branchless-style unsigned subtract: numba types int()
+                # of an unsigned value as uint64, so abs(a - b) would
+                # wrap instead of negating when b is larger.
+                x = p1[i, c]
+                y = p2[i, c]
+                d = x - y if x > y else y - x
+                diff[i, c] = d
+                if d != 0:
+                    differs = True
+            mismatch[i] = differs
+
+
+# Pack each pixel's samples into one uint64: red<<32 | green<<16 | blue.
+# Samples fit 16 bits, so each channel gets its own lane and two pixels
+# are equal exactly when their packed words are equal.
+# input: pixels as sample array of shape (N, 3)
+# result: packed uint64 array of shape (N,)
+def _pack_rgb(pixels: np.ndarray) -> np.ndarray:
+    packed = pixels[:, 0].astype(np.uint64) << 32
+    packed |= pixels[:, 1].astype(np.uint64) << 16
+    packed |= pixels[:, 2].astype(np.uint64)
+    return packed
+
+
+# Compute per-channel differences and the mismatch mask for two pixel
+# arrays, preferring the compiled kernel, then numba, then plain NumPy.
+# input: pixels1 as sample array of shape (N, 3)
+# input: pixels2 as sample array of shape (N, 3)
+# result: (diff array, mismatch mask) pair
+def _diff_arrays(pixels1: np.ndarray, pixels2: np.ndarray):
+    if _native is not None:
+        diff = np.empty_like(pixels1)
+        mismatch = np.empty(len(pixels1), dtype=np.uint8)
+        kernel = (_native.diff_rgb_u8 if pixels1.dtype == np.uint8
+                  else _native.diff_rgb_u16)
+        kernel(np.ascontiguousarray(pixels1), np.ascontiguousarray(pixels2),
+               diff, mismatch, len(pixels1))
+        return (diff, mismatch.view(np.bool_))
+
+    if numba is not None:
+        diff = np.empty_like(pixels1)
+        mismatch = np.empty(len(pixels1), dtype=np.bool_)
+        _diff_kernel(pixels1, pixels2, diff, mismatch)
+        return (diff, mismatch)
+
+    diff = pixel_diff(pixels1, pixels2)
+    mismatch = (_pack_rgb(pixels1) ^ _pack_rgb(pixels2)) != 0
+    return (diff, mismatch)
 
 
 # Determine the reason for a header mismatch.
@@ -95,60 +213,152 @@ def header_match_error(h1: Header, h2: Header) -> str:
         return NO_MISMATCH
 
 
+# Diff one tile of pixels, producing output bytes and a mismatch log.
+# input: pixels1 as sample array of shape (n, 3)
+# input: pixels2 as sample array of shape (n, 3)
+# input: header as Header
+# input: offset as int, index of the tile's first pixel in the image
+# input: quiet as bool, suppressing the mismatch log when True
+# input: binary as bool, producing raw P6 rows instead of ASCII when True
+# input: same_row as bytes, the shared all-max output row
+# input: digit_table as bytes list indexed by sample value (ASCII mode)
+# result: (analog bytes, digital bytes, log text, differ) tuple
+def _diff_tile(pixels1: np.ndarray, pixels2: np.ndarray, header: Header,
+        offset: int, quiet: bool, binary: bool, same_row: bytes,
+        digit_table: List[bytes]):
+    (diff, mismatch) = _diff_arrays(pixels1, pixels2)
+
+    analog_parts = [same_row] * len(pixels1)
+    digital_parts = [same_row] * len(pixels1)
+    log_parts = []
+
+    # Gather the mismatched rows once and convert them to plain int lists
+    # up front; indexing the arrays inside the loop would box a fresh
+    # NumPy scalar for every channel access.
+    mismatch_idx = np.flatnonzero(mismatch)
+    pix1_rows = pixels1[mismatch_idx].tolist()
+    pix2_rows = pixels2[mismatch_idx].tolist()
+    analog_rows = (header.max_color - diff[mismatch_idx]).tolist()
+
+    if not quiet:
+        # One vectorized divmod for every log position instead of a
+        # floor-div and modulo per mismatch.
+        (log_rows, log_cols) = np.divmod(mismatch_idx + offset, header.width)
+        log_rows = log_rows.tolist()
+        log_cols = log_cols.tolist()
+
+    zero_row = b'\x00' * len(same_row) if binary else b'0 0 0 \n'
+
+    for (i, idx) in enumerate(mismatch_idx.tolist()):
+        if not quiet:
+            log_parts.append(
+                'pixels at <row={}, col={}> differ.  {} <-- --> {}\n'.format(
+                    log_rows[i], log_cols[i],
+                    Pixel(*pix1_rows[i]), Pixel(*pix2_rows[i])))
+        if binary:
+            analog_parts[idx] = _pack_p6_row(analog_rows[i], header.max_color)
+        else:
+            (red, green, blue) = analog_rows[i]
+            analog_parts[idx] = (digit_table[red] + digit_table[green]
+                                 + digit_table[blue] + b'\n')
+        digital_parts[idx] = zero_row
+
+    return (b''.join(analog_parts), b''.join(digital_parts),
+            ''.join(log_parts), len(mismatch_idx) != 0)
+
+
 # Process pixels in two images to determine differences. Print differences
-# to output streams.
-# input: pixels1 as Pixel list
-# input: pixels2 as Pixel list
-# input: digital output stream
-# input: analog output stream
+# to output streams. Large images are split into tiles diffed by a pool
+# of worker processes; outputs are stitched back together in order.
+# input: pixels1 as sample array of shape (N, 3)
+# input: pixels2 as sample array of shape (N, 3)
+# input: digital output stream (binary)
+# input: analog output stream (binary)
 # input: header as Header
+# input: quiet as bool, suppressing the mismatch log when True
+# input: binary as bool, emitting raw P6 bodies instead of ASCII when True
 # result: boolean indicating mismatch found
-def process_pixels(pixels1: List[Pixel], pixels2: List[Pixel],
-        out_digital: TextIO, out_analog: TextIO, header: Header) -> bool:
-    differ = False
+def process_pixels(pixels1: np.ndarray, pixels2: np.ndarray,
+        out_digital: BinaryIO, out_analog: BinaryIO, header: Header,
+        quiet: bool, binary: bool) -> bool:
+    if binary:
+        same_row = _pack_p6_row([header.max_color] * 3, header.max_color)
+    else:
+        same_row = b'%d %d %d \n' % (header.max_color, header.max_color,
+                                     header.max_color)
+
+    # Byte-equal images (the common regression-test case) need no per-pixel
+    # work: one memcmp, then a repeated all-max row for both outputs.
+    if np.array_equal(pixels1, pixels2):
+        same_block = same_row * len(pixels1)
+        out_analog.write(same_block)
+        out_digital.write(same_block)
+        return False
+
+    # ASCII for every possible sample value; mismatch rows become three
+    # table lookups instead of three int-to-str formats.
+    digit_table = ([] if binary else
+                   [b'%d ' % value for value in range(header.max_color + 1)])
+
+    tile_count = os.cpu_count() or 1
+    if tile_count == 1 or len(pixels1) < PARALLEL_MIN_PIXELS:
+        results = [_diff_tile(pixels1, pixels2, header, 0, quiet, binary,
+                              same_row, digit_table)]
+    else:
+        tiles1 = np.array_split(pixels1, tile_count)
+        tiles2 = np.array_split(pixels2, tile_count)
+        offsets = [0] * tile_count
+        for i in range(1, tile_count):
+            offsets[i] = offsets[i - 1] + len(tiles1[i - 1])
+        with ProcessPoolExecutor(tile_count) as pool:
+            results = list(pool.map(_diff_tile, tiles1, tiles2,
+                                    [header] * tile_count, offsets,
+                                    [quiet] * tile_count,
+                                    [binary] * tile_count,
+                                    [same_row] * tile_count,
+                                    [digit_table] * tile_count))
+
+    if not quiet:
+        sys.stderr.writelines(log for (_, _, log, _) in results)
 
-    for (idx, (pixel1, pixel2)) in enumerate(zip(pixels1, pixels2)):
-        if pixel1 == pixel2:
-            print('{} {} {} '.format(header.max_color, header.max_color,
-                                     header.max_color), file=out_analog)
-            print('{} {} {} '.format(header.max_color, header.max_color,
-                                     header.max_color), file=out_digital)
-        else:
-            diff = pixel_diff(pixel1, pixel2)
-            print('pixels at <row={}, col={}> differ.  '.format(
-                idx // header.width, idx % header.width),
-                file=sys.stderr, end='')
-            print('{} <-- --> {}'.format(pixel1, pixel2), file=sys.stderr)
-            print('{} {} {} '.format(header.max_color - diff.red,
-                                     header.max_color - diff.green, header.max_color - diff.blue),
-                  file=out_analog)
-            print('0 0 0 '.format(), file=out_digital)
-            differ = True
+    differ = False
+    for (analog, digital, _, tile_differ) in results:
+        out_analog.write(analog)
+        out_digital.write(digital)
+        differ = differ or tile_differ
 
     return differ
 
 
 # Generate the difference images.
-# input: pixels1 as Pixel list
-# input: pixels2 as Pixel list
-# input: digital output stream
-# input: analog output stream
+# input: pixels1 as sample array of shape (N, 3)
+# input: pixels2 as sample array of shape (N, 3)
+# input: digital output stream (binary)
+# input: analog output stream (binary)
 # input: header as Header
+# input: quiet as bool, suppressing the mismatch log when True
+# input: binary as bool, emitting P6 output instead of P3 when True
 # result: boolean indicating mismatch found
-def generate_diffs(pixels1: List[Pixel], pixels2: List[Pixel],
-        out_digital: TextIO, out_analog: TextIO, header: Header) -> bool:
-    write_header(out_digital, header)
-    write_header(out_analog, header)
-    return process_pixels(pixels1, pixels2, out_digital, out_analog, header)
+def generate_diffs(pixels1: np.ndarray, pixels2: np.ndarray,
+        out_digital: BinaryIO, out_analog: BinaryIO, header: Header,
+        quiet: bool, binary: bool) -> bool:
+    write_header(out_digital, header, binary)
+    write_header(out_analog, header, binary)
+    return process_pixels(pixels1, pixels2, out_digital, out_analog, header,
+                          quiet, binary)
 
 
 # Process the P3 image files in the argument list to create difference images.
 # input: argument list as string list
 def main(argv: List[str]) -> None:
+    quiet = QUIET_FLAG in argv
+    binary = BINARY_FLAG in argv
+    argv = [arg for arg in argv if arg not in (QUIET_FLAG, BINARY_FLAG)]
+
     try:
         if check_args(argv):
-            with (open_file(argv[FILE_ARG1], 'r') as infile1,
-                    open_file(argv[FILE_ARG2], 'r') as infile2):
+            with (open_file(argv[FILE_ARG1], 'rb') as infile1,
+                    open_file(argv[FILE_ARG2], 'rb') as infile2):
                 image1 = utility.get_image(infile1)
                 image2 = utility.get_image(infile2)
 
@@ -156,11 +366,11 @@ def main(argv: List[str]) -> None:
                 error(HEADER_MISMATCH.format(
                         header_match_error(image1.header, image2.header)))
 
-            with (open_file(OUT_FILE_DIGITAL, 'w') as out_digital,
-                    open_file(OUT_FILE_ANALOG, 'w') as out_analog):
+            with (open_file(OUT_FILE_DIGITAL, 'wb') as out_digital,
+                    open_file(OUT_FILE_ANALOG, 'wb') as out_analog):
 
                 diff = generate_diffs(image1.pixels, image2.pixels,
-                        out_digital, out_analog, image1.header)
+                        out_digital, out_analog, image1.header, quiet, binary)
             sys.exit(diff)
         else:
             usage(prog_name(argv))
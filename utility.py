@@ -1,12 +1,15 @@
-from data import Header, Pixel, Image, MalformedPixelError,\
+from data import Header, Image, MalformedPixelError,\
         PartialPixelError, P3InvalidHeaderError
+import mmap
 import sys
-from typing import Any, List, TextIO, Tuple
+from typing import Any, BinaryIO, List, Tuple
+
+import numpy as np
 
 MALFORMED_PIXEL = "invalid pixel at <row={}, col={}>"
 PARTIAL_PIXEL = "partial pixel at <row={}, col={}>"
 
-P3_ID = 'P3'
+P3_ID = b'P3'
 
 
 # Convert a value to an integer. If this fails, return a default value.
@@ -21,9 +24,9 @@ def _convert_int(value: Any, default: int) -> int:
 
 
 # Convert the dimensions for the ppm P3 format to integers.
-# input: dimensions as a string
+# input: dimensions as a bytes line
 # result: pair of integer values representing width and height
-def _convert_dimensions(dimension_str: str) -> Tuple[int, int]:
+def _convert_dimensions(dimension_str: bytes) -> Tuple[int, int]:
     dim_list = dimension_str.split()
     if len(dim_list) == 2:
         width = _convert_int(dim_list[0], None)
@@ -36,9 +39,9 @@ def _convert_dimensions(dimension_str: str) -> Tuple[int, int]:
 
 
 # Convert the maximum color for the ppm P3 format to an integer.
-# input: color as string
+# input: color as bytes line
 # result: integer value
-def _convert_color(color_str: str) -> int:
+def _convert_color(color_str: bytes) -> int:
     max_color = _convert_int(color_str, None)
 
     if max_color is None:
@@ -47,14 +50,14 @@ def _convert_color(color_str: str) -> int:
     return max_color
 
 
-# Read (and return) the P3 header from the provided input stream.
-# input: input file as TextIO
+# Read (and return) the P3 header from the provided binary input stream.
+# input: input file as BinaryIO
 # result: Header
-def _read_header(infile: TextIO) -> Header:
+def _read_header(infile: BinaryIO) -> Header:
     first = infile.readline().strip()
     second = infile.readline().strip()
     third = infile.readline().strip()
-    if first != P3_ID or second == '' or third == '':
+    if first != P3_ID or second == b'' or third == b'':
         raise P3InvalidHeaderError()
 
     (width, height) = _convert_dimensions(second)
@@ -63,39 +66,64 @@ def _read_header(infile: TextIO) -> Header:
     return Header(width, height, max_color)
 
 
-# Convert list of strings into a proper pixel or report an error.
-# input: values as list of strings
-# input: row as int, for error messages
-# input: col as int, for error messages
-# result: newly converted pixel
-def _create_pixel(values: List[str], row: int, col: int) -> Pixel:
-    if len(values) < 3:
-        raise PartialPixelError(PARTIAL_PIXEL.format(row, col))
-
-    red = _convert_int(values[0], None)
-    green = _convert_int(values[1], None)
-    blue = _convert_int(values[2], None)
-
-    if red is None or green is None or blue is None:
-        raise MalformedPixelError(MALFORMED_PIXEL.format(row, col))
-
-    return Pixel(red, green, blue)
-
+# Locate the first token that cannot be a pixel sample (error path only).
+# input: tokens as bytes list
+# input: width as int
+# input: bound as int, the largest value the sample dtype can hold
+# result: (row, col) of the pixel containing the bad token
+def _bad_token_position(tokens: List[bytes], width: int,
+        bound: int) -> Tuple[int, int]:
+    bad_idx = 0
+    for idx, token in enumerate(tokens):
+        if not token.isdigit() or int(token) > bound:
+            bad_idx = idx
+            break
+    pixel_idx = bad_idx // 3
+    return (pixel_idx // width, pixel_idx % width)
+
+
+# Read the contents of a P3 ppm file. Samples are stored as uint8 in the
+# common max_color <= 255 case so later arithmetic stays in one byte per
+# channel; deeper images fall back to uint16.
+# input: binary input file as BinaryIO
+# result: Image with header and pixels as a sample array of shape (N, 3)
+def get_image(infile: BinaryIO) -> Image:
+    # Map the file instead of reading it through the stdio buffer; the
+    # kernel pages the contents in directly. Empty files and streams
+    # without a file descriptor fall back to plain reads.
+    try:
+        source = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        source = infile
 
-# Group elements of a list into sublists of size 3.
-# input: values as string list
-# result: list of string lists
-def _groups_of_3(values: List[str]) -> List[List[str]]:
-    return [values[i:i + 3] for i in range(0, len(values), 3)]
+    header = _read_header(source)
+    tokens = source.read().split()
+    if source is not infile:
+        source.close()
+    dtype = np.uint8 if header.max_color <= 255 else np.uint16
 
+    try:
+        flat = np.array(tokens, dtype=dtype)
+    except (ValueError, OverflowError):
+        raise MalformedPixelError(MALFORMED_PIXEL.format(
+            *_bad_token_position(tokens, header.width,
+                                 np.iinfo(dtype).max)))
+
+    expected = 3 * header.width * header.height
+    if flat.size < expected:
+        idx = flat.size // 3
+        raise PartialPixelError(PARTIAL_PIXEL.format(
+            idx // header.width, idx % header.width))
+
+    # Ignore samples beyond the header's pixel count, as the original
+    # zip-based loop did; every consumer assumes exactly width * height
+    # pixels.
+    pixels = flat[:expected].reshape(-1, 3)
+    over = (pixels > header.max_color).any(axis=1)
+    if over.any():
+        idx = int(np.argmax(over))
+        raise MalformedPixelError(MALFORMED_PIXEL.format(
+            idx // header.width, idx % header.width))
 
-# Read the contents of a P3 ppm file.
-# input: input file as TextIO
-# result: Image with header and pixels
-def get_image(infile: TextIO) -> Image:
-    header = _read_header(infile)
-    contents = ''.join(infile.readlines()).split()
-    pixels = [_create_pixel(group, idx // header.width, idx % header.width)
-              for idx, group in enumerate(_groups_of_3(contents))]
     return Image(header, pixels)
 